@@ -122,3 +122,9 @@ USE_TZ = True
 STATIC_URL = 'static/'
 STATICFILES_DIRS = [STATIC_DIR]
 MEDIA_URL = 'media/'
+
+
+# Segmentation
+# Rows per INSERT statement when bulk-creating profiles and segment results.
+
+BULK_CREATE_BATCH_SIZE = 500
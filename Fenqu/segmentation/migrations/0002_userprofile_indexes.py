@@ -0,0 +1,25 @@
+# Generated by Django 6.0 on 2026-10-15 10:12
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('segmentation', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['gender', 'age'], name='segmentatio_gender_feec63_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['purchase_count'], name='segmentatio_purchas_0cb920_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['total_amount'], name='segmentatio_total_a_802c10_idx'),
+        ),
+    ]
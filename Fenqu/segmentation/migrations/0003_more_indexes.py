@@ -0,0 +1,21 @@
+# Generated by Django 6.0 on 2026-10-15 14:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('segmentation', '0002_userprofile_indexes'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='userprofile',
+            index=models.Index(fields=['created_at'], name='segmentatio_created_18e9a8_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='segmentresult',
+            index=models.Index(fields=['task', 'segment_value'], name='segmentatio_task_id_e49256_idx'),
+        ),
+    ]
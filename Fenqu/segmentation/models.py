@@ -25,6 +25,12 @@ class UserProfile(models.Model):
 
     class Meta:
         ordering = ["-created_at"]
+        indexes = [
+            models.Index(fields=["created_at"]),
+            models.Index(fields=["gender", "age"]),
+            models.Index(fields=["purchase_count"]),
+            models.Index(fields=["total_amount"]),
+        ]
 
     def __str__(self) -> str:
         return self.user_id
@@ -61,6 +67,7 @@ class SegmentResult(models.Model):
         indexes = [
             models.Index(fields=["segment_label"]),
             models.Index(fields=["segment_value"]),
+            models.Index(fields=["task", "segment_value"]),
         ]
 
     def __str__(self) -> str:
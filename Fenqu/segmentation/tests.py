@@ -1,3 +1,224 @@
+import io
+from collections import Counter
+from datetime import date, timedelta
+from decimal import Decimal
+from unittest import mock
+
 from django.test import TestCase
+from django.utils import timezone
+
+from sklearn.cluster import KMeans, MiniBatchKMeans
+
+from .models import SegmentationTask, UserProfile
+from . import utils
+from .utils import (
+    MINIBATCH_KMEANS_THRESHOLD,
+    _make_kmeans,
+    apply_cluster_segmentation,
+    apply_rfm_segmentation,
+    generate_sample_data,
+    import_csv_data,
+    import_csv_data_streaming,
+)
+
+
+class ImportCsvDataTests(TestCase):
+    CSV = (
+        "user_id,age,gender,region,last_purchase_date,purchase_count,total_amount,last_channel,last_login_date\n"
+        "U1,30,Male,North,2024-01-05,3,100.50,app,2024/02/01\n"
+        "U2,,female,,2024/03/07,,,,20240408\n"
+        "U3,41.0,other,East,20240509,7,12.3,sms,not-a-date\n"
+        "U4,25,male,West,2024,1,1,app,2024-01-05T10:00:00+08:00\n"
+        "U5,26,male,West,2024/1/5,1,1,app,2024-03\n"
+    )
+
+    def test_import_cleans_columns(self):
+        res = import_csv_data(io.StringIO(self.CSV))
+
+        self.assertEqual(res, {"inserted": 5})
+        u1 = UserProfile.objects.get(user_id="U1")
+        self.assertEqual(u1.age, 30)
+        self.assertEqual(u1.gender, "male")
+        self.assertEqual(u1.region, "North")
+        self.assertEqual(u1.last_purchase_date, date(2024, 1, 5))
+        self.assertEqual(u1.purchase_count, 3)
+        self.assertEqual(u1.total_amount, Decimal("100.50"))
+        self.assertEqual(u1.last_channel, "app")
+        self.assertEqual(u1.last_login_date, date(2024, 2, 1))
+
+        u2 = UserProfile.objects.get(user_id="U2")
+        self.assertIsNone(u2.age)
+        self.assertEqual(u2.region, "")
+        self.assertEqual(u2.last_purchase_date, date(2024, 3, 7))
+        self.assertEqual(u2.purchase_count, 0)
+        self.assertEqual(u2.total_amount, Decimal("0"))
+        self.assertEqual(u2.last_channel, "")
+        self.assertEqual(u2.last_login_date, date(2024, 4, 8))
+
+        u3 = UserProfile.objects.get(user_id="U3")
+        self.assertEqual(u3.age, 41)
+        self.assertEqual(u3.last_purchase_date, date(2024, 5, 9))
+        self.assertEqual(u3.total_amount, Decimal("12.30"))
+        self.assertIsNone(u3.last_login_date)
+
+        # Partial dates and datetimes with offsets are rejected, not guessed at.
+        u4 = UserProfile.objects.get(user_id="U4")
+        self.assertIsNone(u4.last_purchase_date)
+        self.assertIsNone(u4.last_login_date)
+        u5 = UserProfile.objects.get(user_id="U5")
+        self.assertEqual(u5.last_purchase_date, date(2024, 1, 5))
+        self.assertIsNone(u5.last_login_date)
+
+    def test_missing_column_raises(self):
+        with self.assertRaises(ValueError):
+            import_csv_data(io.StringIO("user_id,age\nU1,30\n"))
+        self.assertFalse(UserProfile.objects.exists())
+
+    def test_import_generated_sample(self):
+        res = import_csv_data(generate_sample_data(num_rows=20))
+
+        self.assertEqual(res, {"inserted": 20})
+        self.assertEqual(UserProfile.objects.count(), 20)
+        self.assertTrue(UserProfile.objects.filter(user_id="U00001").exists())
+        for user in UserProfile.objects.all():
+            self.assertTrue(18 <= user.age <= 65)
+            self.assertIn(user.gender, ("male", "female", "other"))
+            self.assertIsNotNone(user.last_purchase_date)
+            self.assertIsNotNone(user.last_login_date)
+
+
+class ImportCsvDataStreamingTests(TestCase):
+    def test_imports_across_batches(self):
+        res = import_csv_data_streaming(generate_sample_data(num_rows=25), batch_size=10)
+
+        self.assertEqual(res, {"inserted": 25})
+        self.assertEqual(UserProfile.objects.count(), 25)
+
+    def test_failure_in_later_batch_rolls_back(self):
+        profiles_from_frame = utils._profiles_from_frame
+        calls = []
+
+        def drop_column_on_second_chunk(df, field_mapping):
+            calls.append(df)
+            if len(calls) == 2:
+                df = df.drop(columns=["age"])
+            return profiles_from_frame(df, field_mapping)
+
+        with mock.patch.object(utils, "_profiles_from_frame", side_effect=drop_column_on_second_chunk):
+            with self.assertRaises(ValueError):
+                import_csv_data_streaming(generate_sample_data(num_rows=25), batch_size=10)
+
+        self.assertEqual(len(calls), 2)
+        self.assertFalse(UserProfile.objects.exists())
+
+class RFMSegmentationTests(TestCase):
+    def setUp(self):
+        today = timezone.now().date()
+        # user_id: (days since last purchase or None, purchase_count, total_amount)
+        users = {
+            "A": (1, 10, 1000),
+            "B": (10, 5, 500),
+            "C": (100, 5, 100),
+            "D": (None, 0, 0),
+            "E": (50, 1, 500),
+            "F": (10, 2, 200),
+        }
+        for user_id, (days, count, amount) in users.items():
+            UserProfile.objects.create(
+                user_id=user_id,
+                last_purchase_date=today - timedelta(days=days) if days is not None else None,
+                purchase_count=count,
+                total_amount=amount,
+            )
+        self.task = SegmentationTask.objects.create(task_name="rfm", task_type="rfm", config={})
+
+    def run_rfm(self):
+        bins = {"recency_bins": 3, "frequency_bins": 3, "monetary_bins": 3}
+        self.assertEqual(apply_rfm_segmentation(self.task, bins), 6)
+        return {r.user.user_id: r for r in self.task.results.select_related("user")}
+
+    def test_labels(self):
+        results = self.run_rfm()
+
+        labels = {user_id: r.segment_value for user_id, r in results.items()}
+        self.assertEqual(
+            labels,
+            {
+                "A": "R3F3M3",
+                "B": "R3F2M2",
+                "C": "R1F2M1",
+                "D": "R1F1M1",
+                "E": "R2F1M2",
+                "F": "R3F2M2",
+            },
+        )
+        self.assertEqual(Counter(labels.values())["R3F2M2"], 2)
+
+    def test_recency_is_reversed(self):
+        results = self.run_rfm()
+
+        self.assertTrue(results["A"].segment_value.startswith("R3"))
+        self.assertTrue(results["C"].segment_value.startswith("R1"))
+
+    def test_ties_share_a_bin(self):
+        results = self.run_rfm()
+
+        # B and F both bought 10 days ago; B and C both have 5 purchases; B and E both spent 500.
+        self.assertEqual(results["B"].segment_value[:2], results["F"].segment_value[:2])
+        self.assertEqual(results["B"].segment_value[2:4], results["C"].segment_value[2:4])
+        self.assertEqual(results["B"].segment_value[4:], results["E"].segment_value[4:])
+
+    def test_missing_purchase_date(self):
+        results = self.run_rfm()
+
+        self.assertIsNone(results["D"].metadata["recency_days"])
+        self.assertTrue(results["D"].segment_value.startswith("R1"))
+        self.assertEqual(results["A"].metadata, {"recency_days": 1, "frequency": 10, "monetary": 1000.0})
+
+
+class ClusterSegmentationTests(TestCase):
+    CONFIG = {"n_clusters": 3, "use_features": ["purchase_count", "total_amount", "recency"]}
+
+    def setUp(self):
+        today = timezone.now().date()
+        # Three well-separated groups of three users each.
+        for group, (count, amount, days) in enumerate([(1, 10, 300), (10, 5000, 30), (30, 20000, 1)]):
+            for i in range(3):
+                UserProfile.objects.create(
+                    user_id=f"G{group}U{i}",
+                    purchase_count=count + i,
+                    total_amount=amount + i,
+                    last_purchase_date=today - timedelta(days=days + i),
+                )
+        self.task = SegmentationTask.objects.create(task_name="cluster", task_type="cluster", config=self.CONFIG)
+
+    def test_results_and_centers(self):
+        self.assertEqual(apply_cluster_segmentation(self.task, self.CONFIG), 9)
+
+        self.task.refresh_from_db()
+        centers = self.task.config["cluster_centers"]
+        self.assertEqual(len(centers), 3)
+        self.assertTrue(all(len(center) == 3 for center in centers))
+        self.assertEqual(self.task.config["n_clusters"], 3)
+
+        results = list(self.task.results.select_related("user"))
+        self.assertEqual(len(results), 9)
+        for result in results:
+            self.assertEqual(set(result.metadata), {"distance"})
+            self.assertIsInstance(result.metadata["distance"], float)
+        groups = {}
+        for result in results:
+            groups.setdefault(result.user.user_id[:2], set()).add(result.segment_value)
+        self.assertTrue(all(len(values) == 1 for values in groups.values()))
+        self.assertEqual(len(set().union(*groups.values())), 3)
+
+    def test_rerun_replaces_results(self):
+        apply_cluster_segmentation(self.task, self.CONFIG)
+        self.assertEqual(apply_cluster_segmentation(self.task, self.CONFIG), 9)
+
+        self.assertEqual(self.task.results.count(), 9)
 
-# Create your tests here.
+    def test_make_kmeans_switches_above_threshold(self):
+        self.assertIsInstance(_make_kmeans(3, MINIBATCH_KMEANS_THRESHOLD), KMeans)
+        self.assertNotIsInstance(_make_kmeans(3, MINIBATCH_KMEANS_THRESHOLD), MiniBatchKMeans)
+        self.assertIsInstance(_make_kmeans(3, MINIBATCH_KMEANS_THRESHOLD + 1), MiniBatchKMeans)
@@ -1,7 +1,6 @@
 from datetime import datetime
 
 from django.contrib import messages
-from django.core.files.storage import default_storage
 from django.db import models, transaction
 from django.http import HttpRequest, HttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
@@ -13,23 +12,23 @@ from .utils import (
     apply_cluster_segmentation,
     apply_rfm_segmentation,
     apply_rule_segmentation,
+    build_rule_queryset,
     generate_sample_data,
     import_csv_data,
+    user_stats,
 )
 
 
 def dashboard(request: HttpRequest) -> HttpResponse:
     recent_tasks = SegmentationTask.objects.all().order_by("-created_at")[:5]
-    total_users = UserProfile.objects.count()
+    # 用户统计
+    stats = user_stats()
     total_tasks = SegmentationTask.objects.count()
     task_type_counts = (
         SegmentationTask.objects.values("task_type")
         .order_by("task_type")
         .annotate(count=models.Count("id"))
     )
-    # 用户统计
-    avg_age = UserProfile.objects.aggregate(avg=models.Avg("age"))["avg"] or 0
-    total_amount_sum = UserProfile.objects.aggregate(sum=models.Sum("total_amount"))["sum"] or 0
     # 性别分布
     gender_dist = (
         UserProfile.objects.values("gender")
@@ -47,11 +46,11 @@ def dashboard(request: HttpRequest) -> HttpResponse:
         "segmentation/dashboard.html",
         {
             "recent_tasks": recent_tasks,
-            "total_users": total_users,
+            "total_users": stats["user_count"],
             "total_tasks": total_tasks,
             "task_type_counts": task_type_counts,
-            "avg_age": round(avg_age, 1),
-            "total_amount_sum": round(total_amount_sum, 2),
+            "avg_age": round(stats["avg_age"], 1),
+            "total_amount_sum": round(stats["total_amount"], 2),
             "gender_dist": gender_dist,
             "region_dist": region_dist,
         },
@@ -60,13 +59,7 @@ def dashboard(request: HttpRequest) -> HttpResponse:
 
 def data_management(request: HttpRequest) -> HttpResponse:
     upload_form = UploadFileForm()
-    user_count = UserProfile.objects.count()
-    stats = {
-        "user_count": user_count,
-        "avg_age": UserProfile.objects.aggregate(avg=models.Avg("age"))["avg"] or 0,
-        "total_amount": UserProfile.objects.aggregate(sum=models.Sum("total_amount"))["sum"] or 0,
-        "avg_purchase_count": UserProfile.objects.aggregate(avg=models.Avg("purchase_count"))["avg"] or 0,
-    }
+    stats = user_stats()
     preview = UserProfile.objects.all()[:20]
     # 数据分布统计
     gender_dist = (
@@ -90,13 +83,11 @@ def data_management(request: HttpRequest) -> HttpResponse:
             upload_form = UploadFileForm(request.POST, request.FILES)
             if upload_form.is_valid():
                 file_obj = upload_form.cleaned_data["file"]
-                saved_path = default_storage.save(f"uploads/{file_obj.name}", file_obj)
-                with default_storage.open(saved_path, "r") as f:
-                    try:
-                        res = import_csv_data(f)
-                        messages.success(request, f"导入成功，新增 {res['inserted']} 条用户数据")
-                    except Exception as exc:  # pylint: disable=broad-except
-                        messages.error(request, f"导入失败: {exc}")
+                try:
+                    res = import_csv_data(file_obj)
+                    messages.success(request, f"导入成功，新增 {res['inserted']} 条用户数据")
+                except Exception as exc:  # pylint: disable=broad-except
+                    messages.error(request, f"导入失败: {exc}")
                 return redirect(reverse("segmentation:data_management"))
         if "sample" in request.POST:
             buffer = generate_sample_data()
@@ -141,26 +132,7 @@ def rule_segmentation(request: HttpRequest) -> HttpResponse:
     # preview count if possible
     if form.is_valid():
         config = form.cleaned_data
-        qs = UserProfile.objects.all()
-        if config.get("age_min") is not None:
-            qs = qs.filter(age__gte=config["age_min"])
-        if config.get("age_max") is not None:
-            qs = qs.filter(age__lte=config["age_max"])
-        if config.get("gender"):
-            qs = qs.filter(gender=config["gender"])
-        if config.get("region"):
-            qs = qs.filter(region__icontains=config["region"])
-        if config.get("purchase_count_min") is not None:
-            qs = qs.filter(purchase_count__gte=config["purchase_count_min"])
-        if config.get("purchase_count_max") is not None:
-            qs = qs.filter(purchase_count__lte=config["purchase_count_max"])
-        if config.get("total_amount_min") is not None:
-            qs = qs.filter(total_amount__gte=config["total_amount_min"])
-        if config.get("total_amount_max") is not None:
-            qs = qs.filter(total_amount__lte=config["total_amount_max"])
-        if config.get("last_channel"):
-            qs = qs.filter(last_channel__icontains=config["last_channel"])
-        preview_count = qs.count()
+        preview_count = build_rule_queryset(config).count()
 
     return render(request, "segmentation/rule_segmentation.html", {"form": form, "preview_count": preview_count})
 
@@ -204,15 +176,15 @@ def results_list(request: HttpRequest) -> HttpResponse:
 
 def result_detail(request: HttpRequest, task_id: int) -> HttpResponse:
     task = get_object_or_404(SegmentationTask, id=task_id)
-    results = SegmentResult.objects.filter(task=task)[:500]
-    total_results = SegmentResult.objects.filter(task=task).count()
+    results = SegmentResult.objects.filter(task=task).select_related("user")[:500]
     # 分群分布统计
-    segment_dist = (
+    segment_dist = list(
         SegmentResult.objects.filter(task=task)
         .values("segment_value")
         .annotate(count=models.Count("id"))
         .order_by("-count")
     )
+    total_results = sum(item["count"] for item in segment_dist)
     return render(
         request,
         "segmentation/result_detail.html",